@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of the result meta envelope encoding and decoding.
+
+Compares the kombu serializer path, including the text round-trip
+of the storage, against the fast codecs available. The peak of memory
+allocated during the operation, including temporary copies, is shown.
+
+Usage: python dev/benchmarks/codec.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+from kombu.serialization import dumps, loads
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from django_storage_celery_results.serialization import (  # noqa
+    CODECS,
+    sniff_codec,
+)
+
+
+METAS = {
+    'small': {
+        'status': 'SUCCESS',
+        'result': 42,
+        'traceback': None,
+        'children': [],
+        'date_done': '2023-01-01T00:00:00.000000+00:00',
+        'task_id': 'f3c7a8e2-5b3d-4b8a-9b0e-6c3a1d2e4f5a',
+    },
+    'medium': {
+        'status': 'SUCCESS',
+        'result': {'items': [{'id': i, 'name': 'item-%s' % i, 'score': i / 3} for i in range(50)]},
+        'traceback': None,
+        'children': [],
+        'date_done': '2023-01-01T00:00:00.000000+00:00',
+        'task_id': 'f3c7a8e2-5b3d-4b8a-9b0e-6c3a1d2e4f5a',
+    },
+}
+
+
+def kombu_encode(meta):
+    """Current path: kombu json serializer, the storage writes the text"""
+    return dumps(meta, serializer='json')[2].encode('utf-8')
+
+
+def kombu_decode(payload):
+    """Current path: the storage reads the text, kombu json deserializer"""
+    return loads(payload.decode('utf-8'), 'application/json', 'utf-8')
+
+
+def codec_decode(payload):
+    """New path: the codec sniffed decodes the bytes read"""
+    codec = sniff_codec(payload)
+    return codec.decode(memoryview(payload)[len(codec.tag):])
+
+
+def measure(func, arg, number):
+    """Returns ops/sec, and peak allocated bytes per op including temporaries"""
+    seconds = min(timeit.repeat(lambda: func(arg), number=number, repeat=3))
+    peaks = []
+    tracemalloc.start()
+    for i in range(100):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        func(arg)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return number / seconds, min(peaks)
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20000, help='Operations per measurement')
+    args = parser.parse_args()
+
+    paths = [('kombu', kombu_encode, kombu_decode)]
+    if CODECS['orjson'].available():
+        # The bare library calls, the orjson codec should be close to them
+        paths.append(('orjson-raw', orjson.dumps, orjson.loads))
+    for name, codec in CODECS.items():
+        if codec.available():
+            paths.append((name, codec().encode, codec_decode))
+        else:
+            print('%s is not installed, skipped' % name)
+
+    print('%-8s %-10s %-7s %8s %14s %12s' % ('meta', 'codec', 'op', 'bytes', 'ops/sec', 'peak/op'))
+    for meta_name, meta in METAS.items():
+        for name, encode, decode in paths:
+            payload = encode(meta)
+            assert decode(payload) == meta
+            for op, func, arg in (('encode', encode, meta), ('decode', decode, payload)):
+                ops, peak = measure(func, arg, args.number)
+                print('%-8s %-10s %-7s %8d %14.0f %12d' % (meta_name, name, op, len(payload), ops, peak))
+
+
+if __name__ == '__main__':
+    main()
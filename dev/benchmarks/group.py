@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Benchmark of the group results collection.
+
+Compares collecting results of the group members one by one
+against the packed group results, using the local storage
+delaying every read like a network storage.
+
+Usage: python dev/benchmarks/group.py [--latency SECONDS] [--sizes N,N,...] [--codec CODEC]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # noqa
+
+
+django.setup()
+
+from celery.result import AsyncResult, GroupResult  # noqa
+from tests.celery import app  # noqa
+
+from django.test import override_settings  # noqa
+
+from django_storage_celery_results.backends import StorageBackend  # noqa
+
+
+def collect(backend, group):
+    """Returns seconds and storage reads to collect the group results"""
+    backend._cache.clear()
+    reads = backend.instance.reads
+    started = time.perf_counter()
+    results = dict(backend.iter_native(group, interval=0))
+    seconds = time.perf_counter() - started
+    assert len(results) == len(group.results)
+    return seconds, backend.instance.reads - reads
+
+
+def run(size, latency):
+    """Run the benchmark for the group of the size"""
+    backend = StorageBackend(app)
+    group = GroupResult(
+        'bench-group-%s' % size,
+        [AsyncResult('bench-task-%s-%s' % (size, i), backend=backend) for i in range(size)],
+        app=app,
+    )
+    backend.instance.latency = 0
+    group.save(backend=backend)
+    for i, result in enumerate(group.results):
+        backend.store_result(result.id, i, 'SUCCESS')
+    backend.instance.latency = latency
+
+    backend.pack_groups = False
+    plain = collect(backend, group)
+    backend.pack_groups = True
+    first = collect(backend, group)
+    packed = collect(backend, group)
+    return plain, first, packed
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.001, help='Storage read latency, seconds')
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='Group sizes')
+    parser.add_argument('--codec', default=None, help='Fast codec of the result meta')
+    args = parser.parse_args()
+
+    location = tempfile.mkdtemp(prefix='celery-results-')
+    try:
+        with override_settings(
+            CELERY_RESULT_STORAGE='tests.storages.LatencyFileSystemStorage',
+            CELERY_RESULT_STORAGE_CONFIG={'location': location},
+            CELERY_RESULT_STORAGE_CODEC=args.codec,
+        ):
+            print('%8s %18s %18s %18s' % ('size', 'plain s/reads', 'packing s/reads', 'packed s/reads'))
+            for size in [int(size) for size in args.sizes.split(',')]:
+                print('%8d' % size + ''.join(
+                    ' %12.4f/%5d' % measure for measure in run(size, args.latency)
+                ))
+    finally:
+        shutil.rmtree(location)
+
+
+if __name__ == '__main__':
+    main()
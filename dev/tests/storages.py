@@ -0,0 +1,54 @@
+"""Storages for testing purposes"""
+import time
+
+from django.core.files.storage import FileSystemStorage
+
+
+class TTLFileSystemStorage(FileSystemStorage):
+    """Local file storage expiring files itself"""
+
+    def __init__(self, *av, **kwargs):
+        """Constructs an instance of the storage"""
+        super().__init__(*av, **kwargs)
+        self.expiry = {}
+
+    def now(self):
+        """Current time, in seconds"""
+        return time.time()
+
+    def set_expiry(self, name, expires):
+        """Set the file expiration, in seconds since now"""
+        self.expiry[name] = self.now() + expires
+
+    def expire(self, name):
+        """Delete the file if expired"""
+        if name in self.expiry and self.expiry[name] <= self.now():
+            del self.expiry[name]
+            self.delete(name)
+
+    def open(self, name, mode='rb'):
+        """Open the file unless expired"""
+        self.expire(name)
+        return super().open(name, mode)
+
+    def exists(self, name):
+        """Check the file exists and not expired"""
+        self.expire(name)
+        return super().exists(name)
+
+
+class LatencyFileSystemStorage(FileSystemStorage):
+    """Local file storage delaying and counting reads like a network storage"""
+
+    def __init__(self, *av, latency=0.001, **kwargs):
+        """Constructs an instance of the storage"""
+        super().__init__(*av, **kwargs)
+        self.latency = latency
+        self.reads = 0
+
+    def open(self, name, mode='rb'):
+        """Open the file after the delay when reading"""
+        if 'r' in mode:
+            self.reads += 1
+            time.sleep(self.latency)
+        return super().open(name, mode)
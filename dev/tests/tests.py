@@ -1,4 +1,6 @@
 """Tests module"""
+import json
+import math
 import os
 import os.path
 import shlex
@@ -7,10 +9,17 @@ import time
 from unittest import mock, skipUnless
 
 import celery
+from celery.result import AsyncResult, GroupResult
 
 from django.test import TestCase, override_settings
 from django.utils import timezone
 
+from django_storage_celery_results.packing import GroupPack
+from django_storage_celery_results.serialization import (
+    MsgpackCodec,
+    OrjsonCodec,
+)
+
 
 class ModuleTest(TestCase):
     """Test of the module"""
@@ -225,3 +234,346 @@ class SafeToRetryTest(TestCase):
             with mock.patch('django.core.files.storage.FileSystemStorage.open', mock.MagicMock(side_effect=E3('e3'))):
                 with self.assertRaises(BackendGetMetaError) as r:
                     ret = storage_backend.get_task_meta('qwertyuiop')
+
+
+class AutoExpireTest(TestCase):
+    """Unit test for storage-side expiration"""
+    maxDiff = None
+
+    def test_autoexpire_not_supported(self):
+        """Test whether the cleanup is required for the plain file storage"""
+        from tests.celery import app
+
+        from django_storage_celery_results.backends import StorageBackend
+
+        storage_backend = StorageBackend(app)
+        self.assertFalse(storage_backend.supports_autoexpire)
+        self.assertIsNone(storage_backend.expiry)
+
+    def test_autoexpire_ttl_storage(self):
+        """Test whether the TTL-aware storage expires results itself"""
+        from tests.celery import app
+
+        from django_storage_celery_results.backends import StorageBackend
+        from django_storage_celery_results.expiry import TTLStorageExpiry
+
+        with override_settings(CELERY_RESULT_STORAGE='tests.storages.TTLFileSystemStorage'):
+            storage_backend = StorageBackend(app)
+            self.assertTrue(storage_backend.supports_autoexpire)
+            self.assertIsInstance(storage_backend.expiry, TTLStorageExpiry)
+
+            storage_backend.store_result('asdfghjkl', {'Hello': 'TTL'}, 'SUCCESS')
+            key = 'celery-task-meta-asdfghjkl'
+            self.assertIn(key, storage_backend.instance.expiry)
+            ret = storage_backend.get_task_meta('asdfghjkl')
+            self.assertEqual(ret['result'], {'Hello': 'TTL'})
+
+            now = storage_backend.instance.now() + storage_backend.expires + 1
+            with mock.patch('tests.storages.TTLFileSystemStorage.now', mock.MagicMock(return_value=now)):
+                storage_backend._cache.clear()
+                ret = storage_backend.get_task_meta('asdfghjkl')
+                self.assertEqual(ret, {'status': 'PENDING', 'result': None})
+                self.assertFalse(storage_backend.instance.exists(key))
+
+    def test_autoexpire_disabled(self):
+        """Test whether the storage-side expiration may be switched off"""
+        from tests.celery import app
+
+        from django_storage_celery_results.backends import StorageBackend
+
+        with override_settings(
+            CELERY_RESULT_STORAGE='tests.storages.TTLFileSystemStorage',
+            CELERY_RESULT_STORAGE_AUTOEXPIRE=False,
+        ):
+            storage_backend = StorageBackend(app)
+            self.assertFalse(storage_backend.supports_autoexpire)
+            storage_backend.store_result('zxcvbnm', {'Hello': 'TTL'}, 'SUCCESS')
+            self.assertEqual(storage_backend.instance.expiry, {})
+            storage_backend.forget('zxcvbnm')
+
+    def test_autoexpire_lifecycle_rules(self):
+        """Test whether bucket lifecycle rules are detected"""
+        from django_storage_celery_results.expiry import (
+            GoogleCloudLifecycleStorageExpiry,
+            S3LifecycleStorageExpiry,
+            detect_expiry,
+        )
+
+        prefixes = ['celery-task-meta-', 'celery-taskset-meta-', 'celery-chord-meta-']
+
+        day = 24 * 60 * 60
+
+        s3 = mock.MagicMock(spec=['bucket', 'location'], location='results')
+        s3.bucket.LifecycleConfiguration.return_value.rules = [
+            {'Status': 'Enabled', 'Expiration': {'Days': 1}, 'Filter': {'Prefix': 'results/celery-task-'}},
+        ]
+        self.assertIsNone(detect_expiry(s3, prefixes, day))
+        s3.bucket.LifecycleConfiguration.return_value.rules.append(
+            {'Status': 'Enabled', 'Expiration': {'Days': 1}, 'Filter': {'Prefix': 'results/'}},
+        )
+        self.assertIsInstance(detect_expiry(s3, prefixes, day), S3LifecycleStorageExpiry)
+        self.assertIsInstance(detect_expiry(s3, prefixes, 3), S3LifecycleStorageExpiry)
+
+        # Separate rules may cover separate prefixes
+        s3.bucket.LifecycleConfiguration.return_value.rules = [
+            {'Status': 'Enabled', 'Expiration': {'Days': 1}, 'Filter': {'Prefix': 'results/%s' % prefix}}
+            for prefix in prefixes
+        ]
+        self.assertIsInstance(detect_expiry(s3, prefixes, day), S3LifecycleStorageExpiry)
+        s3.bucket.LifecycleConfiguration.return_value.rules[-1]['Expiration']['Days'] = 7
+        with self.assertLogs('django_storage_celery_results.expiry', 'WARNING'):
+            self.assertIsNone(detect_expiry(s3, prefixes, day))
+        s3.bucket.LifecycleConfiguration.return_value.rules[-1]['Expiration']['Days'] = 1
+
+        # The rule not matching the expiration is ignored
+        with self.assertLogs('django_storage_celery_results.expiry', 'WARNING'):
+            self.assertIsNone(detect_expiry(s3, prefixes, 7 * day))
+        self.assertIsNone(detect_expiry(s3, prefixes, None))
+
+        # The absent lifecycle configuration is not an error
+        error = Exception('NoSuchLifecycleConfiguration')
+        error.response = {'Error': {'Code': 'NoSuchLifecycleConfiguration'}}
+        s3.bucket.LifecycleConfiguration.side_effect = error
+        with mock.patch('django_storage_celery_results.expiry.logger') as logger:
+            self.assertIsNone(detect_expiry(s3, prefixes, day))
+        logger.exception.assert_not_called()
+
+        gcs = mock.MagicMock(spec=['bucket', 'location'], location='')
+        del gcs.bucket.LifecycleConfiguration
+        gcs.bucket.lifecycle_rules = [
+            {'action': {'type': 'SetStorageClass'}, 'condition': {'age': 1}},
+            {'action': {'type': 'Delete'}, 'condition': {'age': 1, 'matchesPrefix': ['celery-']}},
+        ]
+        self.assertIsInstance(detect_expiry(gcs, prefixes, day), GoogleCloudLifecycleStorageExpiry)
+
+        # The forbidden bucket is not an error
+        error = Exception('Forbidden')
+        error.code = 403
+        gcs.bucket.reload.side_effect = error
+        with mock.patch('django_storage_celery_results.expiry.logger') as logger:
+            self.assertIsNone(detect_expiry(gcs, prefixes, day))
+        logger.exception.assert_not_called()
+
+
+class CodecTest(TestCase):
+    """Unit test for the fast codec of the result meta envelope"""
+    maxDiff = None
+
+    def check_codec(self, name):
+        """Check the codec by name"""
+        from tests.celery import app
+
+        from django_storage_celery_results.backends import StorageBackend
+
+        plain_backend = StorageBackend(app)
+        with override_settings(CELERY_RESULT_STORAGE_CODEC=name):
+            storage_backend = StorageBackend(app)
+        self.assertEqual(storage_backend.codec.name, name)
+
+        # New payloads are tagged and read by both
+        storage_backend.store_result('codec-new', {'Hello': 'Codec', 'list': [1, 2.5, None]}, 'SUCCESS')
+        payload = storage_backend.get('celery-task-meta-codec-new')
+        self.assertTrue(payload.startswith(storage_backend.codec.tag))
+        for backend in (storage_backend, plain_backend):
+            backend._cache.clear()
+            ret = backend.get_task_meta('codec-new')
+            self.assertEqual(ret['status'], 'SUCCESS')
+            self.assertEqual(ret['result'], {'Hello': 'Codec', 'list': [1, 2.5, None]})
+
+        # Old payloads are read by the codec backend
+        plain_backend.store_result('codec-old', {'Hello': 'Kombu'}, 'SUCCESS')
+        self.assertTrue(plain_backend.get('celery-task-meta-codec-old').startswith(b'{'))
+        ret = storage_backend.get_task_meta('codec-old')
+        self.assertEqual(ret['result'], {'Hello': 'Kombu'})
+
+        # Data not supported by the codec falls back to the kombu serializer
+        now = timezone.now()
+        storage_backend.store_result('codec-fallback', {'now': now}, 'SUCCESS')
+        self.assertTrue(storage_backend.get('celery-task-meta-codec-fallback').startswith(b'{'))
+
+        # Non-finite floats are kept
+        storage_backend.store_result('codec-nan', {'nan': float('nan'), 'inf': float('inf'), 'ninf': float('-inf')}, 'SUCCESS')
+        storage_backend._cache.clear()
+        ret = storage_backend.get_task_meta('codec-nan')
+        self.assertTrue(math.isnan(ret['result']['nan']))
+        self.assertEqual(ret['result']['inf'], float('inf'))
+        self.assertEqual(ret['result']['ninf'], float('-inf'))
+
+        # Exceptions are restored
+        storage_backend.store_result('codec-failure', ValueError('Codec'), 'FAILURE')
+        storage_backend._cache.clear()
+        ret = storage_backend.get_task_meta('codec-failure')
+        self.assertIsInstance(ret['result'], ValueError)
+
+        for task_id in ('codec-new', 'codec-old', 'codec-fallback', 'codec-nan', 'codec-failure'):
+            storage_backend.forget(task_id)
+
+    @skipUnless(OrjsonCodec.available(), 'orjson required')
+    def test_codec_orjson(self):
+        """Test whether the orjson codec works"""
+        self.check_codec('orjson')
+
+        # Non-finite floats fall back to the kombu serializer
+        codec = OrjsonCodec()
+        for value in (float('nan'), float('inf'), float('-inf')):
+            with self.assertRaises(ValueError):
+                codec.encode({'result': [{'value': value}]})
+
+    @skipUnless(MsgpackCodec.available(), 'msgpack required')
+    def test_codec_msgpack(self):
+        """Test whether the msgpack codec works"""
+        self.check_codec('msgpack')
+
+    def test_codec_unknown(self):
+        """Test whether the unknown codec is refused"""
+        from celery.exceptions import ImproperlyConfigured
+        from tests.celery import app
+
+        from django_storage_celery_results.backends import StorageBackend
+
+        with override_settings(CELERY_RESULT_STORAGE_CODEC='unknown'):
+            with self.assertRaises(ImproperlyConfigured):
+                StorageBackend(app)
+
+
+class PackTest(TestCase):
+    """Unit test for packed group results"""
+    maxDiff = None
+
+    def setUp(self):
+        """Setup necessary objects"""
+        from tests.celery import app
+
+        from django_storage_celery_results.backends import StorageBackend
+
+        with override_settings(CELERY_RESULT_STORAGE_PACK_GROUPS=True):
+            self.backend = StorageBackend(app)
+        self.group = GroupResult('pack-group', [AsyncResult('pack-task-%s' % i, backend=self.backend) for i in range(5)], app=app)
+        self.group.save(backend=self.backend)
+
+    def tearDown(self):
+        """Free resources"""
+        for result in self.group.results:
+            self.backend.forget(result.id)
+        self.backend.delete_group(self.group.id)
+
+    def collect(self):
+        """Collect group results counting storage reads"""
+        self.backend._cache.clear()
+        self.messages = []
+        with mock.patch.object(self.backend, 'get', wraps=self.backend.get) as get:
+            results = dict(self.backend.iter_native(self.group, interval=0.01, timeout=1, on_message=self.messages.append))
+        self.assertEqual(len(self.messages), len(results))
+        return results, get.call_count
+
+    def test_pack_group(self):
+        """Test whether group results are read from the packed group results"""
+        for i, result in enumerate(self.group.results[:-1]):
+            self.backend.store_result(result.id, i, 'SUCCESS')
+        self.backend.store_result(self.group.results[-1].id, ValueError('Pack'), 'FAILURE')
+
+        results, reads = self.collect()
+        self.assertEqual(reads, 1 + len(self.group.results))
+        self.assertTrue(self.backend.instance.exists('celery-taskset-meta-pack-group.pack'))
+
+        results, reads = self.collect()
+        self.assertEqual(reads, 1)
+        self.assertEqual(
+            {task_id: meta['result'] for task_id, meta in results.items() if meta['status'] == 'SUCCESS'},
+            {result.id: i for i, result in enumerate(self.group.results[:-1])}
+        )
+        self.assertIsInstance(results[self.group.results[-1].id]['result'], ValueError)
+
+        self.backend.delete_group(self.group.id)
+        self.assertFalse(self.backend.instance.exists('celery-taskset-meta-pack-group.pack'))
+
+    def test_pack_group_join_failure(self):
+        """Test whether the group is packed when the join stops on the failure"""
+        for i, result in enumerate(self.group.results[:-1]):
+            self.backend.store_result(result.id, i, 'SUCCESS')
+        self.backend.store_result(self.group.results[-1].id, ValueError('Pack'), 'FAILURE')
+
+        self.backend._cache.clear()
+        with mock.patch.object(GroupResult, 'backend', new_callable=mock.PropertyMock, return_value=self.backend):
+            with self.assertRaises(ValueError):
+                self.group.join_native(interval=0.01, timeout=1)
+        self.assertTrue(self.backend.instance.exists('celery-taskset-meta-pack-group.pack'))
+
+        results, reads = self.collect()
+        self.assertEqual(reads, 1)
+        self.assertIsInstance(results[self.group.results[-1].id]['result'], ValueError)
+
+    def test_pack_group_expiry(self):
+        """Test whether the packed group results expire like other results"""
+        from tests.celery import app
+
+        from django_storage_celery_results.backends import StorageBackend
+
+        for i, result in enumerate(self.group.results):
+            self.backend.store_result(result.id, i, 'SUCCESS')
+        self.assertTrue(self.backend.pack_group(self.group.id))
+        key = 'celery-taskset-meta-pack-group.pack'
+
+        now = timezone.now() + timezone.timedelta(seconds=self.backend.expires + 1)
+        with mock.patch('django_storage_celery_results.backends.timezone.now', mock.MagicMock(return_value=now)):
+            self.backend.cleanup()
+        self.assertFalse(self.backend.instance.exists(key))
+
+        with override_settings(
+            CELERY_RESULT_STORAGE='tests.storages.TTLFileSystemStorage',
+            CELERY_RESULT_STORAGE_PACK_GROUPS=True,
+        ):
+            ttl_backend = StorageBackend(app)
+        self.group.save(backend=ttl_backend)
+        for i, result in enumerate(self.group.results):
+            ttl_backend.store_result(result.id, i, 'SUCCESS')
+        with mock.patch.object(ttl_backend.instance, 'set_expiry', wraps=ttl_backend.instance.set_expiry) as set_expiry:
+            self.assertTrue(ttl_backend.pack_group(self.group.id))
+        set_expiry.assert_called_once_with(key, ttl_backend.expires)
+        self.assertIn(key, ttl_backend.instance.expiry)
+
+    def test_pack_group_corrupted(self):
+        """Test whether the corrupted packed group results are ignored"""
+        for i, result in enumerate(self.group.results):
+            self.backend.store_result(result.id, i, 'SUCCESS')
+        self.assertTrue(self.backend.pack_group(self.group.id))
+        key = self.backend.get_key_for_group_pack(self.group.id)
+        data = self.backend.get(key)
+
+        def table(table):
+            table = json.dumps(table).encode('utf-8')
+            return GroupPack.HEADER.pack(GroupPack.MAGIC, len(table)) + table + data[-10:]
+
+        task_id = self.group.results[0].id
+        for corrupted in (
+            data[:20], data[:-3], data[:4], b'garbage',
+            table({task_id: 5}), table({task_id: [-5, 3]}), table({task_id: [0, 3, 1]}),
+            table({task_id: [0.5, 3]}), table({task_id: [0, 100]}), table([[0, 3]]),
+        ):
+            self.backend.set(key, corrupted)
+            results, reads = self.collect()
+            self.assertEqual(reads, 1 + len(self.group.results))
+            self.assertEqual(
+                {task_id: meta['result'] for task_id, meta in results.items()},
+                {result.id: i for i, result in enumerate(self.group.results)}
+            )
+
+        results, reads = self.collect()
+        self.assertEqual(reads, 1)
+
+    def test_pack_group_not_ready(self):
+        """Test whether the group is not packed until all members are ready"""
+        for i, result in enumerate(self.group.results[:-1]):
+            self.backend.store_result(result.id, i, 'SUCCESS')
+        self.backend.store_result(self.group.results[-1].id, None, 'STARTED')
+
+        with self.assertRaises(celery.exceptions.TimeoutError):
+            self.collect()
+        self.assertFalse(self.backend.pack_group(self.group.id))
+        self.assertFalse(self.backend.instance.exists('celery-taskset-meta-pack-group.pack'))
+
+        self.backend.store_result(self.group.results[-1].id, 4, 'SUCCESS')
+        self.assertTrue(self.backend.pack_group(self.group.id))
+        results, reads = self.collect()
+        self.assertEqual(reads, 1)
+        self.assertEqual(results[self.group.results[-1].id]['result'], 4)
@@ -2,15 +2,22 @@
 
 import logging
 import os.path
+import struct
 
+from celery import states
 from celery.backends.base import KeyValueStoreBackend
 from celery.exceptions import ImproperlyConfigured
-from kombu.utils.encoding import bytes_to_str
+from celery.result import GroupResult, ResultSet
+from kombu.utils.encoding import bytes_to_str, ensure_bytes
 
 from django.conf import settings
 from django.utils import timezone
 from django.utils.module_loading import import_string
 
+from .expiry import detect_expiry
+from .packing import GroupPack
+from .serialization import get_codec, sniff_codec
+
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +31,8 @@ class StorageBackend(KeyValueStoreBackend):
         celery.exceptions.ImproperlyConfigured
     """
 
-    #: Override to call expiration procedure
+    #: Override to call expiration procedure,
+    #: replaced by the instance attribute if the storage expires results itself
     supports_autoexpire = False
 
     def __init__(self, *av, **kwargs):
@@ -61,13 +69,79 @@ class StorageBackend(KeyValueStoreBackend):
             )
         self.safe_to_retry = self.app.conf.get('result_safe_to_retry', False)
         self.always_retry = bool(self.safe_to_retry)
+        self.expiry = self._get_expiry()
+        self.supports_autoexpire = self.expiry is not None
+        self.codec = self._get_codec()
+        self.pack_groups = self.app.conf.get('result_storage_pack_groups', False)
+        # Payloads of group members being collected, by the key
+        self._pack_payloads = {}
+
+    def _get_expiry(self):
+        """Returns the storage-side expiration capability, or None"""
+        autoexpire = self.app.conf.get('result_storage_autoexpire', True)
+        if not autoexpire:
+            return None
+        if autoexpire is True:
+            return detect_expiry(self.instance, [
+                bytes_to_str(prefix) for prefix in (
+                    self.task_keyprefix,
+                    self.group_keyprefix,
+                    self.chord_keyprefix,
+                )
+            ], self.expires)
+        try:
+            expiry = import_string(autoexpire) if isinstance(autoexpire, str) else autoexpire
+            return expiry(self.instance)
+        except Exception:
+            logger.exception('Exception while creating a storage expiration handler')
+            raise ImproperlyConfigured(
+                'Can not create a storage expiration handler: %s',
+                autoexpire
+            )
+
+    def _get_codec(self):
+        """Returns the fast codec of the result meta envelope, or None"""
+        name = self.app.conf.get('result_storage_codec')
+        if not name:
+            return None
+        if self.serializer not in ('json', 'msgpack'):
+            raise ImproperlyConfigured(
+                'The fast codec requires json or msgpack result serializer, not %s',
+                self.serializer
+            )
+        try:
+            return get_codec(name)
+        except Exception:
+            logger.exception('Exception while getting a codec')
+            raise ImproperlyConfigured(
+                'Can not use the codec: %s',
+                name
+            )
+
+    def encode(self, data):
+        """Encode the data by the fast codec if possible"""
+        if self.codec is not None:
+            try:
+                return self.codec.encode(data)
+            except (TypeError, ValueError, OverflowError):
+                logger.debug('Data is not supported by the codec %s, fall back to %s', self.codec.name, self.serializer)
+        return super().encode(data)
+
+    def decode(self, payload):
+        """Decode the payload by the codec sniffed from the payload prefix"""
+        codec = sniff_codec(payload)
+        if codec is not None:
+            return codec.decode(memoryview(payload)[len(codec.tag):])
+        if isinstance(payload, memoryview):
+            payload = payload.tobytes()
+        return super().decode(payload)
 
     def get(self, key):
         """Override to implement. Get the value by the key"""
         key = bytes_to_str(key)
         logger.debug('Reading %s', key)
         try:
-            with self.instance.open(key, 'r') as f:
+            with self.instance.open(key, 'rb') as f:
                 return f.read()
         except FileNotFoundError:
             logger.info('File not found reading %s, ignored', key)
@@ -76,13 +150,25 @@ class StorageBackend(KeyValueStoreBackend):
             # The caller probably might have a logic to resolve it
             raise
 
+    def mget(self, keys):
+        """Override to implement. Get values by keys"""
+        values = [self.get(key) for key in keys]
+        if self._pack_payloads:
+            for key, value in zip(keys, values):
+                key = bytes_to_str(key)
+                if key in self._pack_payloads:
+                    self._pack_payloads[key] = value
+        return values
+
     def set(self, key, value):
         """Override to implement. Set a new value by the key"""
         key = bytes_to_str(key)
         logger.debug('Writing %s: %r', key, value)
         try:
-            with self.instance.open(key, 'w') as f:
+            with self.instance.open(key, 'wb' if isinstance(value, bytes) else 'w') as f:
                 f.write(value)
+            if self.expiry and self.expires:
+                self.expiry.attach(key, self.expires)
         except Exception:
             logger.exception('Exception while writing %s: %r', key, value)
             # The caller probably might have a logic to resolve it
@@ -99,6 +185,142 @@ class StorageBackend(KeyValueStoreBackend):
             # The caller probably might have a logic to resolve it
             raise
 
+    def get_key_for_group_pack(self, group_id):
+        """Get the key for the packed group results by the group id"""
+        return self.get_key_for_group(group_id, '.pack')
+
+    def get_group_pack(self, group_id):
+        """Returns the packed group results, or None if absent or corrupted"""
+        data = self.get(self.get_key_for_group_pack(group_id))
+        if not data:
+            return None
+        try:
+            return GroupPack(data)
+        except (ValueError, TypeError, struct.error):
+            # The pack may be read while being rewritten, results are available anyway
+            logger.warning('Corrupted packed group %s, ignored', group_id, exc_info=True)
+            return None
+
+    def pack_group(self, group_id, task_ids=None, payloads=None):
+        """
+        Stores results of all group members in a single object.
+
+        Task ids are restored from the group if not passed.
+        Payloads read before may be passed as the task id to payload mapping,
+        the rest is read from the storage. Returns False
+        if not all group members are ready.
+        """
+        if task_ids is None:
+            group = self.restore_group(group_id)
+            if group is None:
+                return False
+            task_ids = [result.id for result in group.results if not isinstance(result, ResultSet)]
+        payloads = {task_id: (payloads or {}).get(task_id) for task_id in task_ids}
+        for value in payloads.values():
+            if value and self.decode(value)['status'] not in states.READY_STATES:
+                return False
+        missing = [task_id for task_id, value in payloads.items() if not value]
+        for task_id, value in zip(missing, self.mget([self.get_key_for_task(k) for k in missing])):
+            if not value or self.decode_result(value)['status'] not in states.READY_STATES:
+                return False
+            payloads[task_id] = value
+        logger.debug('Packing group %s of %s results', group_id, len(payloads))
+        self.set(
+            self.get_key_for_group_pack(group_id),
+            GroupPack.pack({task_id: ensure_bytes(value) for task_id, value in payloads.items()})
+        )
+        return True
+
+    def _delete_group(self, group_id):
+        """Delete the group together with the packed group results"""
+        super()._delete_group(group_id)
+        self.delete(self.get_key_for_group_pack(group_id))
+
+    def iter_native(self, result, timeout=None, interval=0.5, no_ack=True,
+                    on_message=None, on_interval=None):
+        """Pass the group id to get results of the group members"""
+        if not self.pack_groups or not isinstance(result, GroupResult) or not result.id:
+            yield from super().iter_native(
+                result,
+                timeout=timeout, interval=interval, no_ack=no_ack,
+                on_message=on_message, on_interval=on_interval,
+            )
+            return
+        self._ensure_not_eager()
+        task_ids = set()
+        for child in result.results:
+            if isinstance(child, ResultSet):
+                yield child.id, child.results
+            else:
+                task_ids.add(child.id)
+        if not task_ids:
+            return
+        yield from self.get_many(
+            task_ids,
+            timeout=timeout, interval=interval, no_ack=no_ack,
+            on_message=on_message, on_interval=on_interval,
+            group_id=result.id,
+        )
+
+    def get_many(self, task_ids, timeout=None, interval=0.5, no_ack=True,
+                 on_message=None, on_interval=None, max_iterations=None,
+                 READY_STATES=states.READY_STATES, group_id=None):
+        """
+        Get results of many tasks.
+
+        Results of the group members are read from the packed group
+        results if the `group_id` is passed. The packed group results
+        are stored when all the group members are ready.
+        """
+        if not self.pack_groups or not group_id:
+            yield from super().get_many(
+                task_ids,
+                timeout=timeout, interval=interval, no_ack=no_ack,
+                on_message=on_message, on_interval=on_interval,
+                max_iterations=max_iterations, READY_STATES=READY_STATES,
+            )
+            return
+        ids = {bytes_to_str(task_id) for task_id in task_ids}
+        task_ids = list(ids)
+        payloads = {}
+        pack = self.get_group_pack(group_id)
+        if pack is not None:
+            for task_id in [task_id for task_id in ids if task_id in pack]:
+                payloads[task_id] = pack.get(task_id)
+                meta = self.decode_result(payloads[task_id])
+                self._cache[task_id] = meta
+                ids.discard(task_id)
+                if on_message is not None:
+                    on_message(meta)
+                yield task_id, meta
+            if not ids:
+                return
+
+        # Payloads are captured by the mget to be packed without rereading
+        keys = {task_id: bytes_to_str(self.get_key_for_task(task_id)) for task_id in ids}
+        for key in keys.values():
+            self._pack_payloads.setdefault(key, None)
+        ready = set()
+        try:
+            for task_id, meta in super().get_many(
+                set(ids),
+                timeout=timeout, interval=interval, no_ack=no_ack,
+                on_message=on_message, on_interval=on_interval,
+                max_iterations=max_iterations, READY_STATES=READY_STATES,
+            ):
+                ready.add(task_id)
+                yield task_id, meta
+        finally:
+            for task_id, key in keys.items():
+                payloads[task_id] = self._pack_payloads.pop(key, None)
+            # The consumer may stop on the first failure while all results are read
+            if READY_STATES == states.READY_STATES and all(task_id in ready or payloads[task_id] for task_id in ids):
+                try:
+                    self.pack_group(group_id, task_ids, payloads)
+                except Exception:
+                    # Packing is an optimization, results are available anyway
+                    logger.exception('Exception while packing group %s', group_id)
+
     def cleanup(self):
         """
         Override to implement. Cleans up old results.
@@ -0,0 +1,200 @@
+"""Storage-side expiration capabilities of the Django Storage backends"""
+
+import logging
+import math
+import posixpath
+
+
+logger = logging.getLogger(__name__)
+
+__all__ = (
+    'StorageExpiry',
+    'TTLStorageExpiry',
+    'LifecycleStorageExpiry',
+    'S3LifecycleStorageExpiry',
+    'GoogleCloudLifecycleStorageExpiry',
+    'EXPIRY_HANDLERS',
+    'detect_expiry',
+)
+
+
+class StorageExpiry:
+    """Base class of the storage expiration capability.
+
+    The capability is detected for the particular storage instance.
+    When detected, the storage removes expired results itself,
+    and the Celery cleanup procedure is not necessary.
+    """
+
+    def __init__(self, storage):
+        """Constructs an instance of the capability for the storage"""
+        self.storage = storage
+
+    @classmethod
+    def detect(cls, storage, prefixes, expires):
+        """
+        Override to implement.
+
+        Returns True if the storage expires all objects
+        having names started from any of the prefixes
+        after `expires` seconds.
+        """
+        return False
+
+    def attach(self, name, expires):
+        """
+        Override to implement. Attach the expiration to the stored object.
+
+        The `expires` is a number of seconds since now.
+        """
+
+
+class TTLStorageExpiry(StorageExpiry):
+    """The storage provides the TTL itself.
+
+    The storage should implement a method `set_expiry(name, expires)`
+    accepting a number of seconds since now when the object expires.
+    """
+
+    @classmethod
+    def detect(cls, storage, prefixes, expires):
+        """Checks whether the storage implements the `set_expiry` method"""
+        return callable(getattr(storage, 'set_expiry', None))
+
+    def attach(self, name, expires):
+        """Passes the expiration to the storage"""
+        self.storage.set_expiry(name, expires)
+
+
+class LifecycleStorageExpiry(StorageExpiry):
+    """The bucket lifecycle configuration expires objects by the name prefix.
+
+    The object is recreated on every write, so the object age
+    counted by the lifecycle is the time since the last write,
+    and nothing should be attached to the object itself.
+
+    Every result prefix should be covered by some rule counting
+    as many days as the result expiration rounded up to days.
+    """
+
+    @classmethod
+    def get_rules(cls, storage):
+        """
+        Override to implement.
+
+        Returns a list of (prefixes, days) pairs of the enabled
+        lifecycle deletion rules applied to the storage.
+        """
+        return []
+
+    @classmethod
+    def is_not_configured(cls, exc):
+        """
+        Override to implement.
+
+        Returns True if the exception means that the lifecycle
+        configuration is absent or not accessible.
+        """
+        return False
+
+    @classmethod
+    def detect(cls, storage, prefixes, expires):
+        """Checks whether lifecycle rules cover objects by every prefix after expiration"""
+        if not expires:
+            return False
+        try:
+            rules = cls.get_rules(storage)
+        except Exception as exc:
+            if cls.is_not_configured(exc):
+                logger.debug('No lifecycle rules available for %s: %s', storage, exc)
+            else:
+                logger.exception('Exception while reading lifecycle rules of %s', storage)
+            return False
+        location = getattr(storage, 'location', '') or ''
+        prefixes = [posixpath.join(location, prefix) for prefix in prefixes]
+        expected = max(1, math.ceil(expires / 86400))
+        uncovered = set(prefixes)
+        for rule_prefixes, days in rules:
+            covered = {prefix for prefix in uncovered if any(prefix.startswith(p) for p in rule_prefixes)}
+            if not covered:
+                continue
+            if days != expected:
+                logger.warning(
+                    'Lifecycle rule of %s expires objects after %s days, while results expire after %s days, ignored',
+                    storage, days, expected
+                )
+                continue
+            logger.debug('Lifecycle rule of %s expires %s after %s days', storage, sorted(covered), days)
+            uncovered -= covered
+        return not uncovered
+
+
+class S3LifecycleStorageExpiry(LifecycleStorageExpiry):
+    """Amazon S3 bucket lifecycle expiration rules"""
+
+    @classmethod
+    def get_rules(cls, storage):
+        """Reads the lifecycle configuration of the S3 bucket"""
+        bucket = getattr(storage, 'bucket', None)
+        if bucket is None or not hasattr(bucket, 'LifecycleConfiguration'):
+            return []
+        rules = []
+        for rule in bucket.LifecycleConfiguration().rules:
+            if rule.get('Status') != 'Enabled' or 'Days' not in rule.get('Expiration', {}):
+                continue
+            rule_filter = rule.get('Filter', {'Prefix': rule.get('Prefix', '')})
+            if set(rule_filter) - {'Prefix'}:
+                # Tag and size conditions do not cover all objects
+                continue
+            rules.append(([rule_filter.get('Prefix', '')], rule['Expiration']['Days']))
+        return rules
+
+    @classmethod
+    def is_not_configured(cls, exc):
+        """Checks the boto3 ClientError code"""
+        code = (getattr(exc, 'response', None) or {}).get('Error', {}).get('Code')
+        return code in ('NoSuchLifecycleConfiguration', 'AccessDenied')
+
+
+class GoogleCloudLifecycleStorageExpiry(LifecycleStorageExpiry):
+    """Google Cloud Storage bucket lifecycle deletion rules"""
+
+    @classmethod
+    def get_rules(cls, storage):
+        """Reads the lifecycle configuration of the GCS bucket"""
+        bucket = getattr(storage, 'bucket', None)
+        if bucket is None or not hasattr(bucket, 'lifecycle_rules'):
+            return []
+        bucket.reload()
+        rules = []
+        for rule in bucket.lifecycle_rules:
+            condition = rule.get('condition', {})
+            if rule.get('action', {}).get('type') != 'Delete' or 'age' not in condition:
+                continue
+            if set(condition) - {'age', 'matchesPrefix'}:
+                # Other conditions do not cover all objects
+                continue
+            rules.append((condition.get('matchesPrefix', ['']), condition['age']))
+        return rules
+
+    @classmethod
+    def is_not_configured(cls, exc):
+        """Checks the HTTP status of the google.api_core exception"""
+        return getattr(exc, 'code', None) in (403, 404)
+
+
+#: Capabilities checked in order while detecting
+EXPIRY_HANDLERS = (
+    TTLStorageExpiry,
+    S3LifecycleStorageExpiry,
+    GoogleCloudLifecycleStorageExpiry,
+)
+
+
+def detect_expiry(storage, prefixes, expires, handlers=EXPIRY_HANDLERS):
+    """Returns the expiration capability instance of the storage, or None"""
+    for handler in handlers:
+        if handler.detect(storage, prefixes, expires):
+            logger.debug('Storage %s expiration detected: %s', storage, handler.__name__)
+            return handler(storage)
+    return None
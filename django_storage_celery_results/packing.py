@@ -0,0 +1,73 @@
+"""Packed group results stored in a single object"""
+
+import json
+import struct
+
+
+__all__ = ('GroupPack',)
+
+
+class GroupPack:
+    """Results of all group members consolidated in a single object.
+
+    The object consists of a header, an offset table, and member payloads
+    stored exactly as they are stored in the task result objects.
+
+    The header contains the magic and the offset table length.
+    The offset table is a JSON object mapping the task id
+    to the (offset, length) pair of its payload
+    counted from the end of the offset table.
+    """
+
+    MAGIC = b'CSGP'
+    HEADER = struct.Struct('>4sI')
+
+    def __init__(self, data):
+        """
+        Constructs an instance reading the packed object.
+
+        Raises ValueError or struct.error if the object is corrupted.
+        """
+        self.view = memoryview(data)
+        magic, length = self.HEADER.unpack_from(self.view)
+        if magic != self.MAGIC:
+            raise ValueError('Not a packed group: %r' % magic)
+        start = self.HEADER.size + length
+        self.table = json.loads(bytes(self.view[self.HEADER.size:start]))
+        self.start = start
+        if not isinstance(self.table, dict):
+            raise ValueError('Not a packed group offset table')
+        for entry in self.table.values():
+            valid = isinstance(entry, list) and len(entry) == 2
+            if not valid or not all(type(value) is int and value >= 0 for value in entry):
+                raise ValueError('Not a packed group offset table entry: %r' % (entry,))
+            if start + entry[0] + entry[1] > len(self.view):
+                raise ValueError('Truncated packed group')
+
+    @classmethod
+    def pack(cls, payloads):
+        """Returns the packed object of the task id to payload mapping"""
+        table = {}
+        offset = 0
+        for task_id, payload in payloads.items():
+            table[task_id] = (offset, len(payload))
+            offset += len(payload)
+        table = json.dumps(table, separators=(',', ':')).encode('utf-8')
+        return b''.join([cls.HEADER.pack(cls.MAGIC, len(table)), table] + list(payloads.values()))
+
+    def __contains__(self, task_id):
+        """Checks whether the task is packed"""
+        return task_id in self.table
+
+    def __len__(self):
+        """Number of tasks packed"""
+        return len(self.table)
+
+    def get(self, task_id):
+        """Returns the memoryview of the task payload, or None"""
+        try:
+            offset, length = self.table[task_id]
+        except KeyError:
+            return None
+        offset += self.start
+        return self.view[offset:offset + length]
@@ -0,0 +1,174 @@
+"""Fast codecs of the result meta envelope"""
+
+import logging
+import math
+
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+logger = logging.getLogger(__name__)
+
+__all__ = (
+    'Codec',
+    'OrjsonCodec',
+    'MsgpackCodec',
+    'CODECS',
+    'get_codec',
+    'sniff_codec',
+)
+
+#: The first byte of the payload encoded by the fast codec,
+#: never produced by the kombu text and pickle serializers
+MAGIC = b'\x00'
+
+
+def _unsupported(obj):
+    """Reject the type not having a plain representation"""
+    raise TypeError('Type is not supported by the fast codec: %s' % type(obj).__name__)
+
+
+def _reject_non_finite(obj):
+    """Reject NaN and infinite floats not having a plain JSON representation"""
+    if isinstance(obj, float):
+        if not math.isfinite(obj):
+            raise ValueError('Non-finite float is not supported by the fast codec: %r' % obj)
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _reject_non_finite(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            _reject_non_finite(value)
+
+
+class Codec:
+    """Base class of the fast codec.
+
+    The fast codec encodes only plain data. Encoding raises
+    TypeError, ValueError, or OverflowError if the data
+    should be encoded by the kombu serializer instead.
+
+    The encoded payload is prefixed by the codec tag
+    to recognize it among payloads encoded by the kombu.
+    """
+
+    #: Codec name used in settings
+    name = None
+    #: Payload prefix
+    tag = None
+    #: Underlying library module, None if not installed
+    library = None
+
+    @classmethod
+    def available(cls):
+        """Returns True if the underlying library is installed"""
+        return cls.library is not None
+
+    def encode(self, data):
+        """Override to implement. Encode data to the tagged bytes"""
+        raise NotImplementedError()
+
+    def decode(self, view):
+        """Override to implement. Decode data from the memoryview without the tag"""
+        raise NotImplementedError()
+
+
+class OrjsonCodec(Codec):
+    """The orjson library codec"""
+
+    name = 'orjson'
+    tag = MAGIC + b'o'
+    library = orjson
+
+    def __init__(self):
+        """Constructs an instance of the codec"""
+        # Pass types having a kombu-specific representation to the default
+        self.option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+
+    def encode(self, data):
+        """Encode data to the tagged bytes"""
+        payload = orjson.dumps(data, default=_unsupported, option=self.option)
+        # The orjson writes NaN and infinity as null, so check the data
+        # only if there are more nulls than top-level None values of the meta
+        nones = sum(value is None for value in data.values()) if isinstance(data, dict) else 0
+        if payload.count(b'null') > nones:
+            _reject_non_finite(data)
+        return self.tag + payload
+
+    def decode(self, view):
+        """Decode data from the memoryview without the tag"""
+        return orjson.loads(view)
+
+
+class MsgpackCodec(Codec):
+    """The msgpack library codec"""
+
+    name = 'msgpack'
+    tag = MAGIC + b'm'
+    library = msgpack
+
+    def encode(self, data):
+        """Encode data to the tagged bytes"""
+        return self.tag + msgpack.packb(data, default=_unsupported, use_bin_type=True)
+
+    def decode(self, view):
+        """Decode data from the memoryview without the tag"""
+        return msgpack.unpackb(view, raw=False, strict_map_key=False)
+
+
+#: Known codecs in order of preference
+CODECS = {
+    OrjsonCodec.name: OrjsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+
+_instances = {}
+
+
+def _get_instance(codec):
+    """Returns the shared instance of the codec class"""
+    if codec.tag not in _instances:
+        _instances[codec.tag] = codec()
+    return _instances[codec.tag]
+
+
+def get_codec(name):
+    """
+    Returns the codec instance by the name.
+
+    The `auto` name means the first available codec, or None.
+    Raises ValueError if the codec is unknown or not installed.
+    """
+    if name == 'auto':
+        for codec in CODECS.values():
+            if codec.available():
+                return _get_instance(codec)
+        logger.info('No fast codec library installed, kombu serializer is used')
+        return None
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError('Unknown codec: %s' % name)
+    if not codec.available():
+        raise ValueError('Codec library is not installed: %s' % name)
+    return _get_instance(codec)
+
+
+def sniff_codec(payload):
+    """Returns the codec instance which encoded the payload, or None"""
+    if not isinstance(payload, (bytes, bytearray, memoryview)) or payload[:1] != MAGIC:
+        return None
+    tag = bytes(payload[:2])
+    for codec in CODECS.values():
+        if codec.tag == tag:
+            if not codec.available():
+                raise ValueError('Codec library is not installed: %s' % codec.name)
+            return _get_instance(codec)
+    raise ValueError('Unknown codec tag: %r' % tag)
@@ -113,6 +113,10 @@ setup(
     #    ],
     #},
     version=version,
+    extras_require={
+        'orjson': ['orjson'],
+        'msgpack': ['msgpack'],
+    },
     entry_points={
         'celery.result_backends': [
             'django-storage = django_storage_celery_results.backends:StorageBackend',